@@ -11,7 +11,7 @@ __status__ = ""
 
 from cogent.util.option_parsing import (
     parse_command_line_parameters, make_option)
-from nshell_generator import make_nshell
+from nshell_generator import make_nshell, watch_nshells, renderers
 
 script_info = {}
 script_info['brief_description'] =\
@@ -22,18 +22,24 @@ script_info['script_description'] = """Reads the input script, looks for its\
 script_info['script_usage'] =\
     [("Example:", "Generate a \"nshell\" file from the \"qimme.py\" script\
     that will run in HPZone1 and will be saved in the \"output\" folder.",
-        "%prog -o ../output -s qiime.py -z HPZone1 -m nshell)")]
+        "%prog -o ../output -s qiime.py -z HPZone1 -m nshell)"),
+     ("Watch:", "Regenerate the \"nshell\" files of the scripts in the\
+    \"scripts\" folder as they change.",
+        "%prog -o ../output --watch scripts -z HPZone1")]
 script_info['output_description'] =\
     "A nshell file that can be run in the n3phele environment"
 script_info['required_options'] = [
-    make_option('-s', '--script_path', type="existing_filepath",
-                help='the QIIME python script filepath to generate'),
     make_option('-o', '--output_dir', type="existing_dirpath",
                 help='output directory where to save the nshell file'),
     make_option('-z', '--zone', type="string",
                 help='zone to run the command')
 ]
 script_info['optional_options'] = [
+    make_option('-s', '--script_path', type="existing_filepaths",
+                help='the QIIME python script filepaths to generate'),
+    make_option('-w', '--watch', type="existing_dirpath",
+                help='folder of QIIME python scripts to watch, regenerating\
+                the files of the changed scripts'),
     make_option('-m', '--name', type="string",
                 help='machine name'),
     make_option('-i', '--image', type="string",
@@ -46,15 +52,44 @@ script_info['optional_options'] = [
                 help='nshell expressions to concatenate and run\
                 before the script execution'),
     make_option('--amazon', default=False,
-                help='adapt CREATEVM parameters for Amazon')
+                help='adapt CREATEVM parameters for Amazon'),
+    make_option('--memoize', type="string",
+                help='shared storage directory where results are stored\
+                and reused when inputs and parameters are unchanged'),
+    make_option('-t', '--targets', type="string", default="nshell",
+                help='comma-separated list of targets to generate\
+                (nshell, galaxy) [default: %default]'),
+    make_option('-p', '--pool', type="string",
+                help='pool of pre-booted VMs to lease the machine from,\
+                a new machine is created only when none is idle'),
+    make_option('--lease_time', type="int",
+                help='seconds before a machine leased from the pool is\
+                taken back if the job never releases it, should be longer\
+                than the job [default: 7200]'),
+    make_option('--compressed', type="choice", choices=['gz', 'zst'],
+                help='input files are uploaded compressed (gz, zst) and\
+                decompressed on the machine')
 ]
 script_info['version'] = __version__
 
 if __name__ == '__main__':
     option_parser, opts, args = parse_command_line_parameters(**script_info)
-    script_path = opts.script_path
+    script_paths = opts.script_path
     output_dir = opts.output_dir
 
+    if script_paths is None and opts.watch is None:
+        option_parser.error("A script path (-s) or a folder to watch (-w)\
+ is required")
+
+    if opts.lease_time is not None and opts.lease_time <= 0:
+        option_parser.error("The lease time must be a positive number of\
+ seconds")
+
+    targets = opts.targets.split(",")
+    for target in targets:
+        if target not in renderers:
+            option_parser.error("Unknown target: %s" % target)
+
     params_cmd = {}
     params_cmd['zone'] = opts.zone
     params_cmd['name'] = opts.name
@@ -63,5 +98,15 @@ if __name__ == '__main__':
     params_cmd['flavor'] = opts.flavor
     params_cmd['concat'] = opts.concat
     params_cmd['amazon'] = opts.amazon
+    params_cmd['memoize'] = opts.memoize
+    params_cmd['pool'] = opts.pool
+    params_cmd['lease_time'] = opts.lease_time
+    params_cmd['compressed'] = opts.compressed
+    params_cmd['targets'] = targets
+
+    if script_paths is not None:
+        for script_path in script_paths:
+            make_nshell(script_path, output_dir, params_cmd)
 
-    make_nshell(script_path, output_dir, params_cmd)
+    if opts.watch is not None:
+        watch_nshells(opts.watch, output_dir, params_cmd)
@@ -9,10 +9,15 @@ __maintainer__ = "Icaro Raupp Henrique"
 __email__ = "icaro.henrique@cpca.pucrs.br"
 __status__ = ""
 
+import re
 import sys
 import traceback
+import hashlib
+import time
 
-from os.path import splitext, split, join, basename
+from glob import glob
+from os.path import splitext, split, join, basename, abspath
+from xml.sax.saxutils import escape, quoteattr
 
 ICON_URL = "http://www.n3phele.com/qiimeIcon"
 
@@ -22,16 +27,71 @@ IMAGE_AMAZON = "ami-578d8e3e"
 FLAVOR_HP = "101"
 FLAVOR_AMAZON = "t1.micro"
 NODE_COUNT = "1"
+# Seconds a leased VM is kept out of the pool if it is never released
+LEASE_TIME = 7200
+
+# Flavor resources: flavor -> (vCPUs, memory in MB)
+FLAVOR_RESOURCES_HP = {
+    "100": (1, 1024),    # standard.xsmall
+    "101": (2, 2048),    # standard.small
+    "102": (2, 4096),    # standard.medium
+    "103": (4, 8192),    # standard.large
+    "104": (4, 16384),   # standard.xlarge
+    "105": (8, 32768),   # standard.2xlarge
+}
+FLAVOR_RESOURCES_AMAZON = {
+    "t1.micro": (1, 613),
+    "m1.small": (1, 1740),
+    "m1.medium": (1, 3840),
+    "m1.large": (2, 7680),
+    "m1.xlarge": (4, 15360),
+    "m2.xlarge": (2, 17510),
+    "m2.2xlarge": (4, 35020),
+    "m2.4xlarge": (8, 70041),
+    "m3.xlarge": (4, 15360),
+    "m3.2xlarge": (8, 30720),
+    "c1.medium": (2, 1740),
+    "c1.xlarge": (8, 7168),
+    "cc2.8xlarge": (32, 61952),
+    "cr1.8xlarge": (32, 249856),
+}
 
 # Constants
 VM_NAME = "vmGen"
+
+# Warm VM pool. LEASEVM and RELEASEVM are not stock nshell commands, they
+# are provided by the VM pool manager (see tests/mock_vm_pool.py):
+# LEASEVM gives an idle VM of the pool with the same image/flavor/nodes,
+# and creates one with the CREATEVM parameters when none is idle.
+# RELEASEVM gives the VM back. If the ON block fails, RELEASEVM is never
+# run and the pool takes the VM back when its lease time is over.
 OPTIONAL_VAR = "OPTIONAL_FILES"
 PATH_FIX = "source /home/ubuntu/sandbox/qiime_software/activate.sh ;"
 
+# Result memoization variables (shell variables inside the ON block)
+MEMO_KEY = "MEMO_KEY"
+MEMO_HIT = "MEMO_HIT"
+MEMO_STATUS = "MEMO_STATUS"
+MEMO_PWD = "MEMO_PWD"
+MEMO_TMP = "MEMO_TMP"
+
+# Decompression variables (shell variables inside the ON block)
+DECOMPRESS_PIDS = "DECOMPRESS_PIDS"
+DECOMPRESS_STATUS = "DECOMPRESS_STATUS"
+
 # Default values when parameters have no default values set
 STR_DEFAULT = ""
 NUM_DEFAULT = 0
 
+# Options that set how many parallel jobs/threads the script runs
+jobs_options = ['jobs_to_start', 'threads', 'num_threads', 'n_jobs']
+# Memory (MB) needed by each job, jobs are limited by the flavor memory
+JOB_MEMORY = 1024
+# Jobs default when the flavor is unknown: computed on the VM
+JOBS_AUTO = 0
+# Shell variable with the jobs computed on the VM
+JOBS_VAR = "MAX_JOBS"
+
 type_converter = {}
 # Parameters types
 type_converter['string'] = "string"
@@ -64,7 +124,27 @@ unsupported_types = [type_converter['choice']]
 dirs_types = [
     type_converter['existing_path'], type_converter['existing_dirpath'],
     type_converter['new_path'], type_converter['new_dirpath']]
-output_dirs = []
+
+# Decompression commands for compressed input files, writing to stdout
+decompressors = {}
+decompressors['gz'] = "pigz -dc"
+decompressors['zst'] = "zstd -dc -T0"
+
+# Watch mode: quiet time (ms) after a burst of changes before regenerating
+WATCH_DEBOUNCE = 50
+
+# Galaxy parameters types
+galaxy_type_converter = {}
+galaxy_type_converter['string'] = "text"
+galaxy_type_converter['int'] = "integer"
+galaxy_type_converter['float'] = "float"
+galaxy_type_converter['boolean'] = "boolean"
+
+# Galaxy datasets formats, other input/output types are plain data
+galaxy_format_converter = {}
+galaxy_format_converter['file'] = "txt"
+galaxy_format_converter['zip'] = "zip"
+GALAXY_FORMAT_DEFAULT = "data"
 
 
 class OptionInfo(object):
@@ -127,6 +207,13 @@ class ScriptInfo(object):
         self.name_param = script_name.replace("_", " ")
         self.description_param = script_info['brief_description']
         self.version_param = script_info['version']
+        try:
+            self.help_param = script_info['script_description']
+        except KeyError:
+            self.help_param = self.description_param
+
+        # Output directories that will be zipped
+        self.output_dirs = []
 
         self.required_options = map(
             OptionInfo, script_info['required_options'])
@@ -141,6 +228,9 @@ class ScriptInfo(object):
         optional_params =\
             self.extract_optional_parameters(self.optional_options)
         self.parameters_list = [required_params, optional_params]
+        # Some int values come with "None" as default
+        # Put 0 to avoid type errors, once for all renderers
+        fill_none_int_defaults(self.parameters_list)
 
         required_output_files =\
             self.extract_required_output_files(self.required_options)
@@ -186,6 +276,8 @@ class ScriptInfo(object):
                 param['label'] = option.label
                 param['short_opt'] = option.short_opt
                 param['long_opt'] = option.long_opt
+                param['jobs'] = option.name in jobs_options and\
+                    option.type == type_converter['int']
                 # Default can come as undeclared value (NoneType) or
                 # default=None (str)
                 if option.default is not None and\
@@ -246,7 +338,7 @@ class ScriptInfo(object):
                 required_options.pop(idx)
 
                 if opt.type in dirs_types:
-                    output_dirs.append(opt.name)
+                    self.output_dirs.append(opt.name)
                     output_file['type'] = "zip"
 
         return required_output_files
@@ -269,13 +361,13 @@ class ScriptInfo(object):
                 optional_options.pop(idx)
 
                 if opt.type in dirs_types:
-                    output_dirs.append(opt.name)
+                    self.output_dirs.append(opt.name)
                     output_file['type'] = "zip"
 
         return optional_output_files
 
 
-def generate_nshell_header(info):
+def generate_nshell_header(info, params_cmd):
     header = ""
     header += fill_name(info.name_param) + '\n'
     header += fill_description(info.description_param) + '\n'
@@ -285,12 +377,9 @@ def generate_nshell_header(info):
     header += fill_privacy() + '\n'
     header += fill_icon() + '\n'
 
-    # Some int values come with "None" as default
-    # Put 0 to avoid type errors
-    fill_none_int_defaults(info.parameters_list)
-
-    header += fill_parameters(info.parameters_list) + '\n'
-    header += fill_input_files(info.input_files_list) + '\n'
+    header += fill_parameters(
+        info.parameters_list, flavor_jobs(params_cmd)) + '\n'
+    header += fill_input_files(info.input_files_list, params_cmd) + '\n'
     header += fill_output_files(info.output_files_list) + '\n'
 
     return header
@@ -369,7 +458,7 @@ def fill_icon():
     return icon
 
 
-def fill_parameters(parameters_list):
+def fill_parameters(parameters_list, jobs=None):
     required_params = parameters_list[0]
     optional_params = parameters_list[1]
 
@@ -393,6 +482,15 @@ def fill_parameters(parameters_list):
         parameters += parameter['type'] + " " + parameter['name']
         parameters += " = "
 
+        # Jobs count comes from the flavor, or from the VM when unknown
+        if parameter['jobs']:
+            parameters += value_format(
+                parameter['type'], jobs if jobs is not None else JOBS_AUTO)
+            parameters += " # " + parameter['label'] +\
+                " ({0}: one job per core of the VM, within its memory)"\
+                .format(JOBS_AUTO)
+            continue
+
         if parameter['default'] is not None:
             parameters += value_format(parameter['type'], parameter['default'])
         else:
@@ -415,7 +513,7 @@ def value_format(type_, value):
         return "{0}".format(value)
 
 
-def fill_input_files(input_files_list):
+def fill_input_files(input_files_list, params_cmd):
     required_input = input_files_list[0]
     optional_input = input_files_list[1]
 
@@ -424,18 +522,33 @@ def fill_input_files(input_files_list):
 
     for input_file in required_input:
         input_files += "\n" + "\t"
-        input_files += input_file['name'] + "." + input_file['type']
+        input_files += input_filename(input_file, params_cmd)
         input_files += " # " + input_file['label']
 
     for input_file in optional_input:
         input_files += "\n" + "\t"
         input_files += "optional "
-        input_files += input_file['name'] + "." + input_file['type']
+        input_files += input_filename(input_file, params_cmd)
         input_files += " # " + input_file['label']
 
     return input_files
 
 
+def is_compressed(input_file, params_cmd):
+    # Only single files can be decompressed, not folders
+    return params_cmd['compressed'] is not None and\
+        input_file['type'] == type_converter['existing_filepath']
+
+
+# Name of the input file as uploaded, e.g. file.txt or file.txt.gz
+def input_filename(input_file, params_cmd):
+    filename = input_file['name'] + "." + input_file['type']
+    if is_compressed(input_file, params_cmd):
+        filename += "." + params_cmd['compressed']
+
+    return filename
+
+
 def fill_output_files(output_files_list):
     required_output = output_files_list[0]
     optional_output = output_files_list[1]
@@ -458,6 +571,19 @@ def fill_output_files(output_files_list):
     return output_files
 
 
+def flavor_jobs(params_cmd):
+    flavors = FLAVOR_RESOURCES_AMAZON if params_cmd['amazon']\
+        else FLAVOR_RESOURCES_HP
+
+    try:
+        vcpus, memory = flavors[params_cmd['flavor']]
+    except KeyError:
+        return None
+
+    # Rounded, as the VM reports a bit less than the flavor memory
+    return max(1, min(vcpus, (memory + JOB_MEMORY // 2) // JOB_MEMORY))
+
+
 def nshell_info(filename):
     info = ""
     info += "# " + filename + "\n"
@@ -470,11 +596,17 @@ def generate_nshell_commands(info, params_cmd):
     commands = ""
     commands += params_cmd['zone'] + ":" + "\n"
 
-    # $$vmGen = CREATEVM <params>
-    commands += "\t" + "$$" + VM_NAME + " = "\
-        + command_createVM(info, params_cmd) + "\n"
+    if params_cmd['pool'] is not None:
+        # $$vmGen = LEASEVM --pool <pool> --name <name> <params>
+        commands += "\t" + "$$" + VM_NAME + " = "\
+            + command_leaseVM(info, params_cmd) + "\n"
+    else:
+        # $$vmGen = CREATEVM <params>
+        commands += "\t" + "$$" + VM_NAME + " = "\
+            + command_createVM(info, params_cmd) + "\n"
     # ON vmGen [--produces ...]
-    commands += "\n\t" + "ON $$" + VM_NAME + " " + generate_produces() + "\n"
+    commands += "\n\t" + "ON $$" + VM_NAME + " " + generate_produces(info)\
+        + "\n"
 
     # script_name.py <required_arguments>
     required_command = command_onVM_required(info, params_cmd)
@@ -482,7 +614,7 @@ def generate_nshell_commands(info, params_cmd):
     # OPTIONAL_VAR=""
     commands += "\t\t" + OPTIONAL_VAR + "=\"\" ;\n"
 
-    commands += command_onVM_optional_files(info) + "\n"
+    commands += command_onVM_optional_files(info, params_cmd) + "\n"
 
     commands += "\n\t\t" + PATH_FIX + "\n"
 
@@ -496,23 +628,55 @@ def generate_nshell_commands(info, params_cmd):
                 commands += "\t\t" + line_text
                 line_text = concat_file.readline()
 
-    commands += "\n\t\t" + required_command + " $" + OPTIONAL_VAR + " " +\
-        command_onVM_optional_params(info) + " ;" + "\n"
+    script_command = required_command + " $" + OPTIONAL_VAR + " " +\
+        command_onVM_optional_params(info)
+
+    # Look for previous results of the same inputs and parameters
+    # and only run the script if none were found
+    if params_cmd['memoize'] is not None:
+        # Jobs counts don't change the results, leave them out of the key
+        memo_command = required_command + " $" + OPTIONAL_VAR + " " +\
+            command_onVM_optional_params(info, False)
+        commands += "\n" + command_memo_lookup(
+            info, params_cmd, memo_command) + "\n"
+
+    jobs = command_onVM_jobs(info)
+    if len(jobs) > 0:
+        commands += "\n" + jobs + "\n"
+
+    decompress = command_onVM_decompress(info, params_cmd)
+    if len(decompress) > 0:
+        commands += "\n" + decompress + "\n"
+
+    if params_cmd['memoize'] is not None:
+        commands += "\n\t\t" + "if [ $" + MEMO_HIT + " -eq 0 ]; then " +\
+            script_command + " ; " + MEMO_STATUS + "=$? ; fi ;" + "\n"
+    else:
+        commands += "\n\t\t" + script_command + " ;" + "\n"
 
-    zips = generate_zips()
+    zips = generate_zips(info, params_cmd['memoize'] is not None)
     if len(zips) > 0:
         commands += "\n\t\t" + zips
 
+    if params_cmd['memoize'] is not None:
+        commands += "\n" + command_memo_publish(info, params_cmd) + "\n"
+        # The ON block fails when the script or the zips failed
+        commands += "\n\t\t" + "[ $" + MEMO_STATUS + " -eq 0 ] ;" + "\n"
+
+    # Give the VM (leased or created) back to the pool for the next jobs
+    if params_cmd['pool'] is not None:
+        commands += "\n\t" + command_releaseVM(info, params_cmd) + "\n"
+
     return commands
 
 
-def generate_produces():
-    if len(output_dirs) > 0:
+def generate_produces(info):
+    if len(info.output_dirs) > 0:
         produces = "--produces [\n{0}]"
         product_format = "\t\t{0}.zip: {0}.zip,\n"
 
         zips = ""
-        for output in output_dirs:
+        for output in info.output_dirs:
             zips += product_format.format(output)
 
         # Need to remove ",\n" from last member
@@ -521,8 +685,8 @@ def generate_produces():
         return ""
 
 
-def generate_zips():
-    if len(output_dirs) > 0:
+def generate_zips(info, memoized=False):
+    if len(info.output_dirs) > 0:
         # Zip output folder contents
         # cd <folder_name> ;
         # zip -r <zip_name> ./ ;
@@ -531,9 +695,17 @@ def generate_zips():
             "cd {0} ;\n\
             zip -r {0} ./ ;\n\
             mv {0}.zip ../ ;\n"
+        # Memoized results already come zipped from the result store,
+        # and a failed zip must not be published
+        if memoized:
+            zip_format =\
+                "if [ $" + MEMO_HIT + " -eq 0 ]; then cd $" + MEMO_PWD +\
+                "/{0} &&\n\
+                zip -r {0} ./ &&\n\
+                mv {0}.zip ../ || " + MEMO_STATUS + "=1 ; fi ;\n"
 
         zips = ""
-        for output in output_dirs:
+        for output in info.output_dirs:
             zips += zip_format.format(output)
 
         return zips
@@ -541,17 +713,135 @@ def generate_zips():
         return ""
 
 
+def memo_salt(info, params_cmd):
+    # Results are only reused for the same script version and
+    # the same additional nshell expressions
+    salt = hashlib.sha1()
+    salt.update(info.version_param)
+    if params_cmd['concat'] is not None:
+        with open(params_cmd['concat'], 'r') as concat_file:
+            salt.update(concat_file.read())
+
+    return salt.hexdigest()
+
+
+def output_filenames(info):
+    filenames = []
+    for output_file in info.output_files_list[0] + info.output_files_list[1]:
+        filenames.append(output_file['name'] + "." + output_file['type'])
+
+    return filenames
+
+
+def command_memo_lookup(info, params_cmd, memo_command):
+    store = params_cmd['memoize'].rstrip("/")
+
+    # Compressed files are hashed as uploaded
+    input_files = []
+    for input_file in info.input_files_list[0] + info.input_files_list[1]:
+        input_files.append(input_filename(input_file, params_cmd))
+
+    # Key = hash of the input files contents, the resolved script command
+    # without jobs options (which carries the parameter values) and the
+    # script version
+    hash_inputs = ""
+    if len(input_files) > 0:
+        hash_inputs = "find {0} -type f 2>/dev/null | sort |\
+ xargs -r sha1sum ; ".format(" ".join(input_files))
+
+    lookup = "\t\t# Result memoization"
+    lookup += "\n\t\t" + MEMO_PWD + "=`pwd` ;"
+    lookup += "\n\t\t" + MEMO_KEY + "=$( ( " + hash_inputs +\
+        "echo " + memo_command + " ; echo \"" +\
+        memo_salt(info, params_cmd) + "\" ) | sha1sum | cut -d \" \" -f 1 ) ;"
+    lookup += "\n\t\t" + MEMO_HIT + "=0 ; " + MEMO_STATUS + "=0 ;"
+    # if [ -d <store>/$MEMO_KEY ]; then cp -r <store>/$MEMO_KEY/. ./ &&
+    # MEMO_HIT=1; fi;
+    lookup += "\n\t\t" + "if [ -d {0}/${1} ]; then cp -r {0}/${1}/. ./ &&\
+ {2}=1; fi;".format(store, MEMO_KEY, MEMO_HIT)
+
+    return lookup
+
+
+def command_memo_publish(info, params_cmd):
+    store = params_cmd['memoize'].rstrip("/")
+
+    filenames = output_filenames(info)
+
+    publish = "\t\t# Publish results"
+    publish += "\n\t\t" + "cd $" + MEMO_PWD + " ;"
+    # Nothing to restore later, so nothing to publish
+    if len(filenames) == 0:
+        return publish
+
+    # Only complete results are published: the script and the zips
+    # succeeded and every output file exists
+    # [ -e <output> ] && ...
+    outputs_exist = " && ".join(
+        ["[ -e {0} ]".format(filename) for filename in filenames])
+
+    # Results are copied to a temporary folder and renamed at once,
+    # so concurrent jobs never see a partially published result
+    publish += "\n\t\t" + "if [ ${0} -eq 0 ] && [ ${1} -eq 0 ] && {2}; then\
+ mkdir -p {3} && {4}=`mktemp -d {3}/.tmp.XXXXXX` &&\
+ cp -r {5} ${4}/ && mv -T ${4} {3}/${6} || rm -rf ${4}; fi;".format(
+        MEMO_HIT, MEMO_STATUS, outputs_exist, store, MEMO_TMP,
+        " ".join(filenames), MEMO_KEY)
+
+    return publish
+
+
 def command_createVM(info, params_cmd):
     command = "CREATEVM "
 
-    is_hpcloud = not params_cmd['amazon']
+    command += command_VM_name(params_cmd)
+    command += command_VM_params(params_cmd)
+
+    return command
+
+
+def command_leaseVM(info, params_cmd):
+    command = "LEASEVM "
+
+    # Only idle VMs of the pool with the same image/flavor are leased,
+    # a VM is created with the same parameters when none is idle
+    command += "--pool " + params_cmd['pool'] + " "
+    command += command_VM_name(params_cmd)
+    command += command_VM_params(params_cmd)
+
+    command += "--leaseTime "
+    if params_cmd['lease_time'] is None:
+        command += str(LEASE_TIME) + " "
+    else:
+        command += str(params_cmd['lease_time']) + " "
+
+    return command
+
 
-    command += "--name "
+def command_releaseVM(info, params_cmd):
+    command = "RELEASEVM "
+
+    command += "--pool " + params_cmd['pool'] + " "
+    command += "$$" + VM_NAME
+
+    return command
+
+
+def command_VM_name(params_cmd):
+    command = "--name "
     if params_cmd['name'] is None:
         command += VM_NAME + " "
     else:
         command += params_cmd['name'] + " "
 
+    return command
+
+
+def command_VM_params(params_cmd):
+    command = ""
+
+    is_hpcloud = not params_cmd['amazon']
+
     if params_cmd['image'] is not None:
         command += "--imageRef " if is_hpcloud else "--imageId "
         command += params_cmd['image'] + " "
@@ -596,14 +886,16 @@ def command_onVM_required(info, params_cmd):
     return command
 
 
-def command_onVM_optional_files(info):
+def command_onVM_optional_files(info, params_cmd):
     optional_checks = "\n\t\t# Optional input files"
     optional_input = info.input_files_list[1]
     for input_file in optional_input:
         optional_checks += "\n\t\t"
         optional_checks += if_optional_file(
             input_file['short_opt'],
-            input_file['name'], input_file['type'], True)
+            input_file['name'], input_file['type'], True,
+            params_cmd['compressed'] if is_compressed(input_file, params_cmd)
+            else None)
 
     optional_checks += "\n\t\t# Optional output files"
     optional_output = info.output_files_list[1]
@@ -616,11 +908,67 @@ def command_onVM_optional_files(info):
     return optional_checks
 
 
-def command_onVM_optional_params(info):
+def command_onVM_decompress(info, params_cmd):
+    if params_cmd['compressed'] is None:
+        return ""
+
+    decompressor = decompressors[params_cmd['compressed']]
+
+    # Files are decompressed in parallel in background, QIIME checks
+    # its input files with isfile() so they can't be streamed (FIFOs)
+    # pigz -dc file.txt.gz > file.txt & DECOMPRESS_PIDS="$DECOMPRESS_PIDS $!" ;
+    decompress_format = "{0} {1} > {2} & " + DECOMPRESS_PIDS + "=\"$" +\
+        DECOMPRESS_PIDS + " $!\" ;"
+    # if [ -f file.txt.gz ]; then pigz ... ; fi;
+    if_format = "if [ -f {0} ]; then {1} fi;"
+    # Skip decompression when results were memoized
+    if_memo_format = "if [ $" + MEMO_HIT + " -eq 0 ]; then {0} fi;"
+
+    decompress = "\t\t# Decompress input files"
+    decompress += "\n\t\t" + DECOMPRESS_PIDS + "=\"\" ; " +\
+        DECOMPRESS_STATUS + "=0 ;"
+    for input_files, is_optional in zip(info.input_files_list,
+                                        [False, True]):
+        for input_file in input_files:
+            if not is_compressed(input_file, params_cmd):
+                continue
+
+            compressed_file = input_filename(input_file, params_cmd)
+            command = decompress_format.format(
+                decompressor, compressed_file,
+                input_file['name'] + "." + input_file['type'])
+            if is_optional:
+                command = if_format.format(compressed_file, command)
+            if params_cmd['memoize'] is not None:
+                command = if_memo_format.format(command)
+
+            decompress += "\n\t\t" + command
+
+    # A corrupt or truncated file stops the run, so the script never runs
+    # on a partial input and nothing is published
+    # for pid in $DECOMPRESS_PIDS; do wait $pid || DECOMPRESS_STATUS=1; done;
+    # if [ $DECOMPRESS_STATUS -ne 0 ]; then exit 1; fi;
+    decompress += "\n\t\t" + "for pid in ${0}; do wait $pid || {1}=1;\
+ done;".format(DECOMPRESS_PIDS, DECOMPRESS_STATUS)
+    decompress += "\n\t\t" + "if [ ${0} -ne 0 ]; then exit 1; fi;".format(
+        DECOMPRESS_STATUS)
+
+    return decompress
+
+
+def command_onVM_optional_params(info, with_jobs=True):
     optional_checks = ""
 
     optional_params = info.parameters_list[1]
     for parameter in optional_params:
+        if parameter['jobs'] and not with_jobs:
+            continue
+        if parameter['jobs']:
+            optional_checks += if_jobs_parameter(
+                parameter['short_opt'], parameter['long_opt'],
+                parameter['name'])
+            continue
+
         optional_checks += if_optional_parameter(
             parameter['short_opt'], parameter['long_opt'],
             parameter['name'], parameter['type'], parameter['default'])
@@ -665,8 +1013,51 @@ def if_optional_parameter(short_opt, long_opt, name, type_, default):
     return if_expr
 
 
+def if_jobs_parameter(short_opt, long_opt, name):
+    # -O <param>
+    param_with_opt_format = "\" {0} \"+$${1}"
+    # --O=<param>
+    param_without_opt_format = "\" {0}=\"+$${1}"
+    # -O $MAX_JOBS
+    auto_with_opt_format = "\" {0} ${1}\""
+    # --O=$MAX_JOBS
+    auto_without_opt_format = "\" {0}=${1}\""
+
+    # $$O!=0?" -O "+$$O:" -O $MAX_JOBS"
+    if_format = " $${0}!={1}?{2}:{3}"
+
+    if short_opt is not None:
+        param = param_with_opt_format.format(short_opt, name)
+        auto = auto_with_opt_format.format(short_opt, JOBS_VAR)
+    else:
+        param = param_without_opt_format.format(long_opt, name)
+        auto = auto_without_opt_format.format(long_opt, JOBS_VAR)
+
+    return if_format.format(name, JOBS_AUTO, param, auto)
+
+
+def command_onVM_jobs(info):
+    has_jobs = False
+    for parameter in info.parameters_list[1]:
+        has_jobs = has_jobs or parameter['jobs']
+    if not has_jobs:
+        return ""
+
+    # Same limits as flavor_jobs(), from the VM cores and memory:
+    # one job per core, one job per JOB_MEMORY MB (rounded), at least one
+    jobs = "\t\t# Jobs from the VM cores and memory"
+    jobs += "\n\t\t" + "{0}=$(( ( $(free -m | grep ^Mem: | tr -s \" \" |\
+ cut -d \" \" -f 2) + {1} ) / {2} )) ;".format(
+        JOBS_VAR, JOB_MEMORY // 2, JOB_MEMORY)
+    jobs += "\n\t\t" + "if [ ${0} -gt $(nproc) ]; then {0}=$(nproc); fi;\
+ if [ ${0} -lt 1 ]; then {0}=1; fi;".format(JOBS_VAR)
+
+    return jobs
+
+
 # Boolean parameter needed because "optional" output is not supported
-def if_optional_file(short_opt, name, ext, is_optional):
+# Compressed optional input files are checked as uploaded
+def if_optional_file(short_opt, name, ext, is_optional, compression=None):
     # file.txt
     file_format = "{0}.{1}"
     # -p file.txt
@@ -684,37 +1075,330 @@ def if_optional_file(short_opt, name, ext, is_optional):
 
     param_with_file = param_with_file_format.format(short_opt, file_with_ext)
 
+    checked_file = file_with_ext
+    if compression is not None:
+        checked_file = file_format.format(file_with_ext, compression)
+
     if is_optional:
-        return if_format.format(file_with_ext, OPTIONAL_VAR, param_with_file)
+        return if_format.format(checked_file, OPTIONAL_VAR, param_with_file)
     else:
         return if_format_non_optional.format(OPTIONAL_VAR, param_with_file)
 
 
+def render_nshell(info, params_cmd):
+    filename = params_cmd['script'] + ".n"
+
+    nshell = ""
+    nshell += nshell_info(filename)
+    nshell += generate_nshell_header(info, params_cmd)
+    nshell += generate_nshell_commands(info, params_cmd)
+
+    return filename, nshell
+
+
+def render_galaxy(info, params_cmd):
+    filename = params_cmd['script'] + ".xml"
+
+    tool = ""
+    tool += "<tool id={0} name={1} version={2}>\n".format(
+        quoteattr(params_cmd['script']), quoteattr(info.name_param),
+        quoteattr(info.version_param))
+    tool += "\t<description>" + escape(info.description_param) +\
+        "</description>\n"
+    tool += "\t<requirements>\n"
+    tool += "\t\t<requirement type=\"package\" version={0}>qiime\
+</requirement>\n".format(quoteattr(info.version_param.split("-")[0]))
+    tool += "\t</requirements>\n"
+    tool += "\t<command><![CDATA[\n" + generate_galaxy_command(
+        info, params_cmd) + "\n\t]]></command>\n"
+    tool += generate_galaxy_inputs(info)
+    tool += generate_galaxy_outputs(info)
+    tool += "\t<help>" + escape(info.help_param) + "</help>\n"
+    tool += "</tool>\n"
+
+    return filename, tool
+
+
+def galaxy_label(option):
+    # Jobs count defaults to the slots given to the job by Galaxy
+    default = "Galaxy slots" if option.get('jobs') else option.get('default')
+    return option['label'].replace("%default", str(default))
+
+
+def galaxy_option(option, value):
+    # -d value
+    if option['short_opt'] is not None:
+        return "{0} {1}".format(option['short_opt'], value)
+    # --d=value
+    else:
+        return "{0}={1}".format(option['long_opt'], value)
+
+
+# #if $<bool_param>
+#     -d
+# #end if
+def galaxy_if_boolean(parameter):
+    flag = parameter['short_opt'] if parameter['short_opt'] is not None\
+        else parameter['long_opt']
+
+    return "\n\t\t#if $" + parameter['name'] + "\n\t\t\t" + flag +\
+        "\n\t\t#end if"
+
+
+def generate_galaxy_command(info, params_cmd):
+    command = "\t\t" + params_cmd['script'] + ".py"
+
+    for parameter in info.parameters_list[0]:
+        if parameter['type'] == type_converter['boolean']:
+            command += galaxy_if_boolean(parameter)
+        else:
+            command += "\n\t\t" + galaxy_option(
+                parameter, "\"$" + parameter['name'] + "\"")
+
+    for input_file in info.input_files_list[0]:
+        command += "\n\t\t" + galaxy_option(
+            input_file, "\"$" + input_file['name'] + "\"")
+
+    # Output folders are written to the working directory and zipped later
+    for output_file in info.output_files_list[0] +\
+            info.output_files_list[1]:
+        value = output_file['name'] if output_file['type'] == "zip"\
+            else "\"$" + output_file['name'] + "\""
+        command += "\n\t\t" + galaxy_option(output_file, value)
+
+    # #if $<file>
+    #     -p "$<file>"
+    # #end if
+    for input_file in info.input_files_list[1]:
+        command += "\n\t\t#if $" + input_file['name']
+        command += "\n\t\t\t" + galaxy_option(
+            input_file, "\"$" + input_file['name'] + "\"")
+        command += "\n\t\t#end if"
+
+    for parameter in info.parameters_list[1]:
+        if parameter['type'] == type_converter['boolean']:
+            command += galaxy_if_boolean(parameter)
+            continue
+
+        command += "\n\t\t#if str($" + parameter['name'] + ")"
+        command += "\n\t\t\t" + galaxy_option(
+            parameter, "\"$" + parameter['name'] + "\"")
+        # Jobs count defaults to the slots given to the job by Galaxy
+        if parameter['jobs']:
+            command += "\n\t\t#else"
+            command += "\n\t\t\t" + galaxy_option(
+                parameter, "\\${GALAXY_SLOTS:-1}")
+        command += "\n\t\t#end if"
+
+    # cd <folder_name> && zip -r ../<folder_name>.zip ./ && cd .. &&
+    # mv <folder_name>.zip "$<folder_name>"
+    for output in info.output_dirs:
+        command += "\n\t\t&& cd {0} && zip -r ../{0}.zip ./ && cd ..\
+ && mv {0}.zip \"${0}\"".format(output)
+
+    return command
+
+
+def generate_galaxy_inputs(info):
+    param_format = "\t\t<param name={0} type={1} {2}={3} label={4}{5}/>\n"
+    data_format =\
+        "\t\t<param name={0} type=\"data\" format={1} label={2}{3}/>\n"
+    optional_attr = " optional=\"true\""
+
+    inputs = "\t<inputs>\n"
+
+    for parameters, optional in zip(info.parameters_list, [False, True]):
+        for parameter in parameters:
+            value = parameter['default']
+            if value is None or value == "None" or parameter.get('jobs'):
+                value = ""
+            # Booleans are checkboxes, always present
+            if parameter['type'] == type_converter['boolean']:
+                inputs += param_format.format(
+                    quoteattr(parameter['name']),
+                    quoteattr(galaxy_type_converter[parameter['type']]),
+                    "checked", quoteattr(str(value).lower()),
+                    quoteattr(galaxy_label(parameter)), "")
+            else:
+                inputs += param_format.format(
+                    quoteattr(parameter['name']),
+                    quoteattr(galaxy_type_converter[parameter['type']]),
+                    "value", quoteattr(str(value)),
+                    quoteattr(galaxy_label(parameter)),
+                    optional_attr if optional else "")
+
+    for input_files, optional in zip(info.input_files_list, [False, True]):
+        for input_file in input_files:
+            inputs += data_format.format(
+                quoteattr(input_file['name']),
+                quoteattr(galaxy_format_converter.get(
+                    input_file['type'], GALAXY_FORMAT_DEFAULT)),
+                quoteattr(galaxy_label(input_file)),
+                optional_attr if optional else "")
+
+    inputs += "\t</inputs>\n"
+
+    return inputs
+
+
+def generate_galaxy_outputs(info):
+    data_format = "\t\t<data name={0} format={1} label={2}/>\n"
+
+    outputs = "\t<outputs>\n"
+
+    # Optional output not supported, as in the nshell
+    for output_file in info.output_files_list[0] +\
+            info.output_files_list[1]:
+        outputs += data_format.format(
+            quoteattr(output_file['name']),
+            quoteattr(galaxy_format_converter.get(
+                output_file['type'], GALAXY_FORMAT_DEFAULT)),
+            quoteattr(galaxy_label(output_file)))
+
+    outputs += "\t</outputs>\n"
+
+    return outputs
+
+
+# Available output targets, all rendered from the same ScriptInfo
+renderers = {}
+renderers['nshell'] = render_nshell
+renderers['galaxy'] = render_galaxy
+
+
 def make_nshell(script_path, output_dir, params_cmd):
     dir_path, command = split(script_path)
     script_name, extension = splitext(command)
 
     try:
-        script_qiime = __import__(script_name)
+        # Scripts changed since the last import (watch mode) are reloaded
+        if script_name in sys.modules:
+            script_qiime = reload(sys.modules[script_name])
+        else:
+            script_qiime = __import__(script_name)
 
+        # Script information is extracted once for all targets
         info = ScriptInfo(script_qiime.script_info, script_name)
 
-        nshell_header = generate_nshell_header(info)
-
         params_cmd['script'] = script_name
-        nshell_commands = generate_nshell_commands(info, params_cmd)
-
-        filename = script_name+".n"
-
-        nshell_file = open(join(output_dir, filename), 'w')
+        for target in params_cmd['targets']:
+            filename, content = renderers[target](info, params_cmd)
 
-        nshell_file.write(nshell_info(filename))
-        nshell_file.write(nshell_header)
-        nshell_file.write(nshell_commands)
-
-        nshell_file.close()
+            output_file = open(join(output_dir, filename), 'w')
+            output_file.write(content)
+            output_file.close()
     except Exception as e:
         top = traceback.extract_tb(sys.exc_info()[2])[-1]
         print "Error processing \'{0}\': ".format(script_name) +\
             ", ".join([type(e).__name__, basename(top[0]),
             str(top[1])]) + ", " + str(e)
+        return False
+
+    return True
+
+
+def is_watched_script(path, watch_dir):
+    dir_path, filename = split(path)
+    # Skip editors temporary files, e.g. .script.py.swp or .#script.py
+    return abspath(dir_path) == abspath(watch_dir) and\
+        splitext(filename)[1] == ".py" and not filename.startswith(".")
+
+
+# Helper modules in the watched folder are not QIIME scripts
+def defines_script_info(script_path):
+    try:
+        with open(script_path, 'r') as script_file:
+            return re.search(r"^script_info\s*=", script_file.read(),
+                             re.MULTILINE) is not None
+    # Removed or renamed since it changed
+    except IOError:
+        return False
+
+
+def changed_scripts(changed, watch_dir, concat_path):
+    # Changed scripts are regenerated, and all the QIIME scripts
+    # when the concatenated nshell expressions change
+    # Returns script path -> time of its first change
+    scripts = {}
+    for path, changed_time in changed.items():
+        if path == concat_path:
+            paths = [abspath(script_path)
+                     for script_path in glob(join(watch_dir, "*.py"))]
+        elif is_watched_script(path, watch_dir):
+            paths = [abspath(path)]
+        else:
+            paths = []
+
+        for script_path in paths:
+            if defines_script_info(script_path):
+                scripts[script_path] = min(
+                    changed_time, scripts.get(script_path, changed_time))
+
+    return scripts
+
+
+def regenerate_scripts(scripts, output_dir, params_cmd):
+    # Returns script path -> latency (ms) since its first change
+    latencies = {}
+
+    # Failed regenerations were already reported by make_nshell
+    for script_path, changed_time in sorted(scripts.items()):
+        if not make_nshell(script_path, output_dir, params_cmd):
+            continue
+
+        latencies[script_path] = (time.time() - changed_time) * 1000
+        print "Regenerated \'{0}\' in {1:.1f} ms".format(
+            basename(script_path), latencies[script_path])
+
+    return latencies
+
+
+def watch_nshells(watch_dir, output_dir, params_cmd):
+    try:
+        import pyinotify
+    except ImportError:
+        raise ImportError("Watch mode requires pyinotify")
+
+    # Scripts are imported from the watched folder, always from the source
+    sys.path.insert(0, abspath(watch_dir))
+    sys.dont_write_bytecode = True
+
+    concat_path = abspath(params_cmd['concat'])\
+        if params_cmd['concat'] is not None else None
+
+    # Editors may replace files instead of writing them
+    mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO
+    watch_manager = pyinotify.WatchManager()
+    watch_manager.add_watch(abspath(watch_dir), mask)
+    if concat_path is not None:
+        watch_manager.add_watch(split(concat_path)[0], mask)
+
+    # Changed file -> time of its first change in the current burst
+    changed = {}
+
+    def collect(event):
+        if event.pathname not in changed:
+            changed[event.pathname] = time.time()
+
+    notifier = pyinotify.Notifier(
+        watch_manager, collect, timeout=WATCH_DEBOUNCE)
+
+    print "Watching \'{0}\'".format(watch_dir)
+    try:
+        while True:
+            # Wait until no changes arrive for WATCH_DEBOUNCE ms
+            if notifier.check_events():
+                notifier.read_events()
+                notifier.process_events()
+                continue
+            if len(changed) == 0:
+                continue
+
+            regenerate_scripts(
+                changed_scripts(changed, watch_dir, concat_path),
+                output_dir, params_cmd)
+            changed.clear()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        notifier.stop()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+__author__ = "Icaro Raupp Henrique"
+__copyright__ = ""
+__credits__ = ["Icaro Raupp Henrique"]
+__license__ = ""
+__version__ = "2.2.1"
+__maintainer__ = "Icaro Raupp Henrique"
+__email__ = "icaro.henrique@cpca.pucrs.br"
+__status__ = ""
+
+import sys
+
+from copy import copy
+from optparse import Option
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, join(dirname(abspath(__file__)), "..", "scripts"))
+
+from nshell_generator import PATH_FIX
+
+
+class QiimeOption(Option):
+    # Option types added by QIIME scripts, values are not checked
+    TYPES = Option.TYPES + (
+        "existing_filepath", "existing_filepaths", "existing_dirpath",
+        "existing_path", "new_filepath", "new_dirpath", "new_path")
+    TYPE_CHECKER = copy(Option.TYPE_CHECKER)
+    for type_ in TYPES[len(Option.TYPES):]:
+        TYPE_CHECKER[type_] = lambda option, opt, value: value
+
+
+make_option = QiimeOption
+
+
+def default_params_cmd(**params):
+    params_cmd = {
+        'zone': "HPZone1", 'name': None, 'image': None, 'nodes': None,
+        'flavor': None, 'concat': None, 'amazon': False, 'memoize': None,
+        'pool': None, 'lease_time': None, 'compressed': None,
+        'targets': ['nshell'], 'script': "test_script"}
+    params_cmd.update(params)
+    return params_cmd
+
+
+def on_block(commands):
+    # Shell lines of the ON block, without the --produces list
+    # and the QIIME environment activation
+    lines = []
+    in_block = False
+    in_produces = False
+    for line in commands.split("\n"):
+        if line.startswith("\tON "):
+            in_block = True
+            in_produces = line.rstrip().endswith("[")
+        elif in_produces:
+            in_produces = not line.rstrip().endswith("]")
+        elif in_block and line.startswith("\t") and\
+                not line.startswith("\t\t"):
+            in_block = False
+        elif in_block and line.strip() != PATH_FIX:
+            lines.append(line)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+__author__ = "Icaro Raupp Henrique"
+__copyright__ = ""
+__credits__ = ["Icaro Raupp Henrique"]
+__license__ = ""
+__version__ = "2.2.1"
+__maintainer__ = "Icaro Raupp Henrique"
+__email__ = "icaro.henrique@cpca.pucrs.br"
+__status__ = ""
+
+# Local mock of the VM pool manager that provides LEASEVM and RELEASEVM,
+# and a small interpreter for the VM commands of a generated nshell zone:
+#
+#   $$vmGen = LEASEVM --pool <pool> --name <name> <params>
+#             --leaseTime <seconds>
+#   ON $$vmGen ...
+#   RELEASEVM --pool <pool> $$vmGen
+#
+# LEASEVM leases an idle VM of the pool with the same parameters, or
+# creates a new VM of the pool when none is idle. A failing ON block stops
+# the zone, as in n3phele, so RELEASEVM is not run and the VM is only back
+# after its lease time.
+
+# VM parameters that must match for a pooled VM to be leased
+VM_PARAMS = [
+    'imageRef', 'imageId', 'nodeCount', 'minCount',
+    'flavorRef', 'instanceType']
+
+
+class MockVMPool(object):
+    def __init__(self):
+        # Current time (seconds), moved by the tests
+        self.now = 0
+        # VM id -> VM parameters
+        self.vms = {}
+        # Pool name -> list of pooled VM ids
+        self.pools = {}
+        # VM id -> time when its lease is over
+        self.leases = {}
+        self.created = []
+
+    def add_vm(self, pool, params):
+        vm = self.create(params)
+        self.release(pool, vm)
+        return vm
+
+    def create(self, params):
+        vm = "vm%d" % (len(self.vms) + 1)
+        self.vms[vm] = vm_params(params)
+        self.created.append(vm)
+        return vm
+
+    def lease(self, pool, params, lease_time):
+        leased = None
+        for vm in self.pools.get(pool, []):
+            if self.vms[vm] == vm_params(params) and self.is_idle(vm):
+                leased = vm
+                break
+        if leased is None:
+            leased = self.create(params)
+            self.pools.setdefault(pool, []).append(leased)
+
+        self.leases[leased] = self.now + int(lease_time)
+        return leased
+
+    def release(self, pool, vm):
+        if vm not in self.pools.setdefault(pool, []):
+            self.pools[pool].append(vm)
+        self.leases.pop(vm, None)
+
+    def is_idle(self, vm):
+        return vm not in self.leases or self.leases[vm] <= self.now
+
+
+def vm_params(params):
+    return dict([(name, value) for name, value in params.items()
+                 if name in VM_PARAMS])
+
+
+def parse_arguments(arguments):
+    # --name value ... [$$var]
+    params = {}
+    positional = []
+    tokens = arguments.split()
+    while len(tokens) > 0:
+        token = tokens.pop(0)
+        if token.startswith("--"):
+            params[token[2:]] = tokens.pop(0)
+        else:
+            positional.append(token)
+    return params, positional
+
+
+def run_zone(commands, pool, on_vm):
+    # Only the VM commands of the zone (one tab) are run,
+    # the ON block (two tabs) is replaced by on_vm(vm)
+    variables = {}
+
+    def value(term):
+        term = term.strip()
+        if term.startswith("$$"):
+            return variables.get(term[2:], "")
+
+        command, _, arguments = term.partition(" ")
+        params, positional = parse_arguments(arguments)
+        if command == "LEASEVM":
+            return pool.lease(params['pool'], params, params['leaseTime'])
+        elif command == "CREATEVM":
+            return pool.create(params)
+        elif command == "RELEASEVM":
+            pool.release(params['pool'], value(positional[0]))
+            return ""
+        raise ValueError("Unknown command: %s" % command)
+
+    for line in commands.split("\n"):
+        if not line.startswith("\t") or line.startswith("\t\t"):
+            continue
+        line = line.strip()
+
+        if line.startswith("ON "):
+            on_vm(value(line.split()[1]))
+        elif " = " in line:
+            name, expression = line.split(" = ", 1)
+            variables[name[2:]] = value(expression)
+        else:
+            value(line)
+
+    return variables
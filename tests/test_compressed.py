@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+__author__ = "Icaro Raupp Henrique"
+__copyright__ = ""
+__credits__ = ["Icaro Raupp Henrique"]
+__license__ = ""
+__version__ = "2.2.1"
+__maintainer__ = "Icaro Raupp Henrique"
+__email__ = "icaro.henrique@cpca.pucrs.br"
+__status__ = ""
+
+import gzip
+import os
+import stat
+import subprocess
+import unittest
+
+from distutils.spawn import find_executable
+from os.path import exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from helpers import make_option, default_params_cmd, on_block
+from nshell_generator import ScriptInfo, generate_nshell_header,\
+    generate_nshell_commands
+
+script_info = {}
+script_info['brief_description'] = "Test script"
+script_info['version'] = "1.8.0"
+script_info['required_options'] = [
+    make_option('-i', '--input_fp', type="existing_filepath", help='input'),
+    make_option('-o', '--output_dir', type="new_dirpath", help='output')
+]
+script_info['optional_options'] = [
+    make_option('-r', '--refseqs_fp', type="existing_filepath",
+                help='reference')
+]
+
+# Copies its inputs to output_dir, as QIIME it only accepts regular files
+TEST_SCRIPT = """#!/bin/sh
+echo run >> "$TEST_RUNS"
+mkdir -p output_dir
+while [ $# -gt 0 ]; do
+    case $1 in
+        -i) [ -f "$2" ] || exit 1 ; cp "$2" output_dir/input.txt ;;
+        -r) [ -f "$2" ] || exit 1 ; cp "$2" output_dir/refseqs.txt ;;
+    esac
+    shift
+done
+"""
+# pigz is not always installed where the tests run
+PIGZ = """#!/bin/sh
+exec gzip "$@"
+"""
+
+
+class CompressedTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.runs = join(self.tmp_dir, "runs")
+        self.store = join(self.tmp_dir, "store")
+
+        bin_dir = join(self.tmp_dir, "bin")
+        os.mkdir(bin_dir)
+        for name, content in [("test_script.py", TEST_SCRIPT),
+                              ("pigz", PIGZ)]:
+            with open(join(bin_dir, name), 'w') as command_file:
+                command_file.write(content)
+            os.chmod(join(bin_dir, name), stat.S_IRWXU)
+
+        self.env = dict(os.environ)
+        self.env['PATH'] = bin_dir + os.pathsep + self.env['PATH']
+        self.env['TEST_RUNS'] = self.runs
+
+        self.info = ScriptInfo(script_info, "test_script")
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def run_job(self, files, **params):
+        job_dir = mkdtemp(dir=self.tmp_dir)
+        for name, content in files.items():
+            with open(join(job_dir, name), 'wb') as job_file:
+                job_file.write(content)
+
+        block = on_block(generate_nshell_commands(
+            self.info, default_params_cmd(**params)))
+        status = subprocess.call(
+            ["bash", "-c", block], cwd=job_dir, env=self.env,
+            stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+        return status, job_dir
+
+    def gz(self, content):
+        path = join(self.tmp_dir, "content.gz")
+        gz_file = gzip.open(path, 'wb')
+        gz_file.write(content)
+        gz_file.close()
+        with open(path, 'rb') as gz_file:
+            return gz_file.read()
+
+    def read(self, path):
+        with open(path, 'rb') as output_file:
+            return output_file.read()
+
+    def test_header(self):
+        header = generate_nshell_header(
+            self.info, default_params_cmd(compressed="gz"))
+        self.assertTrue("\tinput_fp.file.gz # input" in header)
+        self.assertTrue("\toptional refseqs_fp.file.gz # reference" in header)
+
+    def test_decompress(self):
+        status, job_dir = self.run_job(
+            {"input_fp.file.gz": self.gz("seqs" * 1000)}, compressed="gz")
+
+        self.assertEqual(status, 0)
+        self.assertEqual(self.read(join(job_dir, "output_dir", "input.txt")),
+                         "seqs" * 1000)
+        self.assertFalse(exists(join(job_dir, "output_dir", "refseqs.txt")))
+
+    def test_decompress_optional(self):
+        status, job_dir = self.run_job(
+            {"input_fp.file.gz": self.gz("seqs"),
+             "refseqs_fp.file.gz": self.gz("refs")}, compressed="gz")
+
+        self.assertEqual(status, 0)
+        self.assertEqual(
+            self.read(join(job_dir, "output_dir", "refseqs.txt")), "refs")
+
+    @unittest.skipIf(find_executable("zstd") is None, "zstd not installed")
+    def test_decompress_zst(self):
+        path = join(self.tmp_dir, "content")
+        with open(path, 'w') as content_file:
+            content_file.write("seqs")
+        subprocess.check_call(["zstd", "-q", path])
+
+        status, job_dir = self.run_job(
+            {"input_fp.file.zst": self.read(path + ".zst")},
+            compressed="zst")
+
+        self.assertEqual(status, 0)
+        self.assertEqual(
+            self.read(join(job_dir, "output_dir", "input.txt")), "seqs")
+
+    def test_truncated_file_stops_run(self):
+        truncated = self.gz("seqs" * 1000)[:-20]
+
+        status, job_dir = self.run_job(
+            {"input_fp.file.gz": truncated}, compressed="gz")
+
+        self.assertNotEqual(status, 0)
+        self.assertFalse(exists(self.runs))
+
+    def test_truncated_file_not_published(self):
+        truncated = self.gz("seqs" * 1000)[:-20]
+
+        status, job_dir = self.run_job(
+            {"input_fp.file.gz": truncated}, compressed="gz",
+            memoize=self.store)
+
+        self.assertNotEqual(status, 0)
+        self.assertFalse(exists(self.runs))
+        self.assertFalse(exists(self.store) and len([
+            name for name in os.listdir(self.store)
+            if not name.startswith(".")]) > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
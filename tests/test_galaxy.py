@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+__author__ = "Icaro Raupp Henrique"
+__copyright__ = ""
+__credits__ = ["Icaro Raupp Henrique"]
+__license__ = ""
+__version__ = "2.2.1"
+__maintainer__ = "Icaro Raupp Henrique"
+__email__ = "icaro.henrique@cpca.pucrs.br"
+__status__ = ""
+
+import unittest
+
+from xml.etree import ElementTree
+
+from helpers import make_option, default_params_cmd
+from nshell_generator import ScriptInfo, render_galaxy, render_nshell
+
+script_info = {}
+script_info['brief_description'] = "Test script"
+script_info['script_description'] = "Runs the test script"
+script_info['version'] = "1.8.0-dev"
+script_info['required_options'] = [
+    make_option('-i', '--input_fp', type="existing_filepath", help='input'),
+    make_option('-o', '--output_dir', type="new_dirpath", help='output'),
+    make_option('-n', '--count', type="int", default=None,
+                help='count [default: %default]'),
+    make_option('-x', '--exact', action="store_true", help='exact match')
+]
+script_info['optional_options'] = [
+    make_option('-r', '--refseqs_fp', type="existing_filepath",
+                help='reference'),
+    make_option('-m', '--method', type="string", default="uclust",
+                help='method [default: %default]'),
+    make_option('-O', '--jobs_to_start', type="int", default=1,
+                help='jobs [default: %default]'),
+    make_option('-v', '--verbose', action="store_true", help='verbose')
+]
+
+
+def render(info):
+    filename, tool = render_galaxy(info, default_params_cmd())
+    return filename, ElementTree.fromstring(tool)
+
+
+class GalaxyTests(unittest.TestCase):
+    def setUp(self):
+        self.info = ScriptInfo(script_info, "test_script")
+        self.filename, self.tool = render(self.info)
+        self.params = dict([(param.get('name'), param)
+                            for param in self.tool.find('inputs')])
+        self.command = self.tool.find('command').text
+
+    def test_tool(self):
+        self.assertEqual(self.filename, "test_script.xml")
+        self.assertEqual(self.tool.get('id'), "test_script")
+        self.assertEqual(self.tool.get('version'), "1.8.0-dev")
+        self.assertEqual(self.tool.find('help').text, "Runs the test script")
+
+    def test_inputs(self):
+        self.assertEqual(sorted(self.params.keys()), [
+            'count', 'exact', 'input_fp', 'jobs_to_start', 'method',
+            'refseqs_fp', 'verbose'])
+
+        self.assertEqual(self.params['count'].get('type'), "integer")
+        self.assertEqual(self.params['count'].get('value'), "0")
+        self.assertEqual(self.params['count'].get('optional'), None)
+        self.assertEqual(self.params['exact'].get('type'), "boolean")
+        self.assertEqual(self.params['exact'].get('checked'), "false")
+        self.assertEqual(self.params['method'].get('value'), "uclust")
+        self.assertEqual(self.params['method'].get('label'),
+                         "method [default: uclust]")
+        self.assertEqual(self.params['method'].get('optional'), "true")
+        self.assertEqual(self.params['input_fp'].get('type'), "data")
+        self.assertEqual(self.params['refseqs_fp'].get('optional'), "true")
+
+    def test_jobs_default_to_galaxy_slots(self):
+        self.assertEqual(self.params['jobs_to_start'].get('value'), "")
+        self.assertEqual(self.params['jobs_to_start'].get('label'),
+                         "jobs [default: Galaxy slots]")
+        self.assertTrue("#else\n\t\t\t-O \\${GALAXY_SLOTS:-1}" in
+                        self.command)
+
+    def test_command(self):
+        lines = [line.strip() for line in self.command.split("\n")]
+
+        self.assertEqual(lines[1], "test_script.py")
+        self.assertTrue('-n "$count"' in lines)
+        self.assertTrue('-i "$input_fp"' in lines)
+        self.assertTrue('-o output_dir' in lines)
+        # Booleans are bare flags, required or not
+        self.assertTrue("#if $exact" in lines)
+        self.assertTrue("-x" in lines)
+        self.assertFalse('-x "$exact"' in lines)
+        self.assertTrue("#if $verbose" in lines)
+        self.assertTrue("-v" in lines)
+        self.assertTrue("#if $refseqs_fp" in lines)
+        self.assertTrue('-r "$refseqs_fp"' in lines)
+        self.assertTrue("#if str($method)" in lines)
+        self.assertTrue('&& cd output_dir && zip -r ../output_dir.zip ./ &&'
+                        ' cd .. && mv output_dir.zip "$output_dir"' in lines)
+
+    def test_outputs(self):
+        outputs = self.tool.find('outputs')
+        self.assertEqual([(data.get('name'), data.get('format'))
+                          for data in outputs], [("output_dir", "zip")])
+
+    def test_targets_order(self):
+        info = ScriptInfo(script_info, "test_script")
+        render_nshell(info, default_params_cmd())
+
+        filename, tool = render(info)
+        self.assertEqual(ElementTree.tostring(tool),
+                         ElementTree.tostring(self.tool))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+__author__ = "Icaro Raupp Henrique"
+__copyright__ = ""
+__credits__ = ["Icaro Raupp Henrique"]
+__license__ = ""
+__version__ = "2.2.1"
+__maintainer__ = "Icaro Raupp Henrique"
+__email__ = "icaro.henrique@cpca.pucrs.br"
+__status__ = ""
+
+import os
+import stat
+import subprocess
+import unittest
+
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from helpers import make_option, default_params_cmd
+from nshell_generator import ScriptInfo, generate_nshell_header,\
+    generate_nshell_commands, command_onVM_jobs, flavor_jobs
+
+script_info = {}
+script_info['brief_description'] = "Test script"
+script_info['version'] = "1.8.0"
+script_info['required_options'] = [
+    make_option('-i', '--input_fp', type="existing_filepath", help='input')
+]
+script_info['optional_options'] = [
+    make_option('-O', '--jobs_to_start', type="int", default=1,
+                help='jobs'),
+    make_option('--threads', type="int", default=1, help='threads')
+]
+
+# free -m output of a VM with the given total memory
+FREE = """#!/bin/sh
+echo "              total        used        free"
+echo "Mem:          $TEST_MEMORY         100        100"
+echo "Swap:             0           0           0"
+"""
+NPROC = """#!/bin/sh
+echo $TEST_CORES
+"""
+
+
+class JobsTests(unittest.TestCase):
+    def setUp(self):
+        self.info = ScriptInfo(script_info, "test_script")
+
+    def test_flavor_jobs(self):
+        self.assertEqual(flavor_jobs(default_params_cmd(flavor="105")), 8)
+        self.assertEqual(flavor_jobs(default_params_cmd(flavor="101")), 2)
+        self.assertEqual(flavor_jobs(default_params_cmd(
+            flavor="m1.large", amazon=True)), 2)
+        # Limited by memory
+        self.assertEqual(flavor_jobs(default_params_cmd(
+            flavor="c1.xlarge", amazon=True)), 7)
+        self.assertEqual(flavor_jobs(default_params_cmd(
+            flavor="t1.micro", amazon=True)), 1)
+        self.assertEqual(flavor_jobs(default_params_cmd(flavor="999")), None)
+        self.assertEqual(flavor_jobs(default_params_cmd()), None)
+
+    def test_header_default(self):
+        header = generate_nshell_header(
+            self.info, default_params_cmd(flavor="105"))
+        self.assertTrue("\toptional int jobs_to_start = 8 # jobs" in header)
+        self.assertTrue("\toptional int threads = 8 # threads" in header)
+
+        header = generate_nshell_header(self.info, default_params_cmd())
+        self.assertTrue("\toptional int jobs_to_start = 0 # jobs" in header)
+
+    def test_command(self):
+        commands = generate_nshell_commands(self.info, default_params_cmd())
+
+        self.assertTrue(command_onVM_jobs(self.info) in commands)
+        self.assertTrue(
+            ' $$jobs_to_start!=0?" -O "+$$jobs_to_start:" -O $MAX_JOBS"'
+            in commands)
+        self.assertTrue(
+            ' $$threads!=0?" --threads="+$$threads:" --threads=$MAX_JOBS"'
+            in commands)
+
+    def test_no_jobs_options(self):
+        info = ScriptInfo({
+            'brief_description': "Test script", 'version': "1.8.0",
+            'required_options': script_info['required_options']},
+            "test_script")
+
+        self.assertEqual(command_onVM_jobs(info), "")
+
+    def vm_jobs(self, cores, memory):
+        tmp_dir = mkdtemp()
+        try:
+            for name, content in [("free", FREE), ("nproc", NPROC)]:
+                with open(join(tmp_dir, name), 'w') as command_file:
+                    command_file.write(content)
+                os.chmod(join(tmp_dir, name), stat.S_IRWXU)
+
+            env = dict(os.environ)
+            env['PATH'] = tmp_dir + os.pathsep + env['PATH']
+            env['TEST_CORES'] = str(cores)
+            env['TEST_MEMORY'] = str(memory)
+            output = subprocess.Popen(
+                ["bash", "-c",
+                 command_onVM_jobs(self.info) + "\necho $MAX_JOBS"],
+                env=env, stdout=subprocess.PIPE).communicate()[0]
+            return int(output)
+        finally:
+            rmtree(tmp_dir)
+
+    def test_vm_jobs(self):
+        # Same limits as the flavors table, from what the VM reports
+        self.assertEqual(self.vm_jobs(8, 32000), 8)
+        self.assertEqual(self.vm_jobs(2, 1990), 2)
+        self.assertEqual(self.vm_jobs(8, 6990), 7)
+        self.assertEqual(self.vm_jobs(1, 590), 1)
+        self.assertEqual(self.vm_jobs(4, 300), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+__author__ = "Icaro Raupp Henrique"
+__copyright__ = ""
+__credits__ = ["Icaro Raupp Henrique"]
+__license__ = ""
+__version__ = "2.2.1"
+__maintainer__ = "Icaro Raupp Henrique"
+__email__ = "icaro.henrique@cpca.pucrs.br"
+__status__ = ""
+
+import os
+import stat
+import subprocess
+import unittest
+
+from os.path import exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from helpers import make_option, default_params_cmd, on_block
+from nshell_generator import ScriptInfo, generate_nshell_commands
+
+script_info = {}
+script_info['brief_description'] = "Test script"
+script_info['version'] = "1.8.0"
+script_info['required_options'] = [
+    make_option('-i', '--input_fp', type="existing_filepath", help='input'),
+    make_option('-o', '--output_dir', type="new_dirpath", help='output')
+]
+
+# Writes output_dir/result.txt from the input, fails when TEST_FAIL is set
+TEST_SCRIPT = """#!/bin/sh
+echo run >> "$TEST_RUNS"
+[ -n "$TEST_FAIL" ] && exit 1
+mkdir -p output_dir && cp input_fp.file output_dir/result.txt
+"""
+
+
+class MemoizeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.store = join(self.tmp_dir, "store")
+        self.runs = join(self.tmp_dir, "runs")
+
+        bin_dir = join(self.tmp_dir, "bin")
+        os.mkdir(bin_dir)
+        script_path = join(bin_dir, "test_script.py")
+        with open(script_path, 'w') as script_file:
+            script_file.write(TEST_SCRIPT)
+        os.chmod(script_path, stat.S_IRWXU)
+
+        self.env = dict(os.environ)
+        self.env['PATH'] = bin_dir + os.pathsep + self.env['PATH']
+        self.env['TEST_RUNS'] = self.runs
+
+        info = ScriptInfo(script_info, "test_script")
+        self.block = on_block(generate_nshell_commands(
+            info, default_params_cmd(memoize=self.store)))
+
+    def tearDown(self):
+        rmtree(self.tmp_dir)
+
+    def run_job(self, name, content="seqs", fail=False):
+        job_dir = join(self.tmp_dir, name)
+        os.mkdir(job_dir)
+        with open(join(job_dir, "input_fp.file"), 'w') as input_file:
+            input_file.write(content)
+
+        env = dict(self.env)
+        if fail:
+            env['TEST_FAIL'] = "1"
+        status = subprocess.call(
+            ["bash", "-c", self.block], cwd=job_dir, env=env,
+            stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+        return status, job_dir
+
+    def script_runs(self):
+        if not exists(self.runs):
+            return 0
+        with open(self.runs) as runs_file:
+            return len(runs_file.readlines())
+
+    def stored_results(self):
+        if not exists(self.store):
+            return []
+        return [name for name in os.listdir(self.store)
+                if not name.startswith(".")]
+
+    def test_miss_then_hit(self):
+        status, job_dir = self.run_job("first")
+        self.assertEqual(status, 0)
+        self.assertEqual(self.script_runs(), 1)
+        self.assertEqual(len(self.stored_results()), 1)
+
+        status, job_dir = self.run_job("second")
+        self.assertEqual(status, 0)
+        # The script is skipped and the zip restored from the store
+        self.assertEqual(self.script_runs(), 1)
+        self.assertTrue(exists(join(job_dir, "output_dir.zip")))
+        self.assertFalse(exists(join(job_dir, "output_dir")))
+
+    def test_other_input_misses(self):
+        self.run_job("first")
+        self.run_job("second", content="other seqs")
+
+        self.assertEqual(self.script_runs(), 2)
+        self.assertEqual(len(self.stored_results()), 2)
+
+    def test_failed_run_not_published(self):
+        status, job_dir = self.run_job("failed", fail=True)
+        self.assertNotEqual(status, 0)
+        self.assertEqual(self.stored_results(), [])
+
+        status, job_dir = self.run_job("retry")
+        self.assertEqual(status, 0)
+        self.assertEqual(self.script_runs(), 2)
+        self.assertEqual(len(self.stored_results()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+__author__ = "Icaro Raupp Henrique"
+__copyright__ = ""
+__credits__ = ["Icaro Raupp Henrique"]
+__license__ = ""
+__version__ = "2.2.1"
+__maintainer__ = "Icaro Raupp Henrique"
+__email__ = "icaro.henrique@cpca.pucrs.br"
+__status__ = ""
+
+import unittest
+
+from helpers import make_option, default_params_cmd
+from nshell_generator import ScriptInfo, generate_nshell_commands
+from mock_vm_pool import MockVMPool, run_zone
+
+script_info = {}
+script_info['brief_description'] = "Test script"
+script_info['version'] = "1.8.0"
+script_info['required_options'] = [
+    make_option('-i', '--input', type="string", help='input')
+]
+
+
+def pool_commands(**params):
+    params_cmd = default_params_cmd(
+        image="360427", flavor="101", pool="qiime", lease_time=100)
+    params_cmd.update(params)
+
+    info = ScriptInfo(script_info, "test_script")
+    return generate_nshell_commands(info, params_cmd)
+
+
+class VMPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = MockVMPool()
+        self.ran_on = []
+
+    def run_job(self, commands):
+        return run_zone(commands, self.pool, self.ran_on.append)
+
+    def test_generated_commands(self):
+        commands = pool_commands(name="qiime_vm")
+
+        # The pool manager creates the VM, no conditional in the nshell
+        self.assertTrue("\t$$vmGen = LEASEVM --pool qiime --name qiime_vm\
+ --imageRef 360427 --flavorRef 101 --leaseTime 100 \n" in commands)
+        self.assertTrue("CREATEVM" not in commands)
+        self.assertTrue("?" not in commands)
+        self.assertTrue("\n\tRELEASEVM --pool qiime $$vmGen\n" in commands)
+
+    def test_lease_idle_vm(self):
+        vm = self.pool.add_vm(
+            "qiime", {'imageRef': "360427", 'flavorRef': "101"})
+
+        self.run_job(pool_commands())
+
+        self.assertEqual(self.ran_on, [vm])
+        self.assertEqual(self.pool.created, [vm])
+        self.assertTrue(self.pool.is_idle(vm))
+
+    def test_create_vm_when_none_is_idle(self):
+        self.run_job(pool_commands())
+
+        self.assertEqual(len(self.pool.created), 1)
+        vm = self.pool.created[0]
+        self.assertEqual(self.ran_on, [vm])
+        # The created VM is released into the pool for the next jobs
+        self.assertEqual(self.pool.pools["qiime"], [vm])
+
+        self.run_job(pool_commands())
+
+        self.assertEqual(self.ran_on, [vm, vm])
+        self.assertEqual(self.pool.created, [vm])
+
+    def test_create_vm_when_flavor_differs(self):
+        pooled = self.pool.add_vm(
+            "qiime", {'imageRef': "360427", 'flavorRef': "101"})
+
+        self.run_job(pool_commands(flavor="105"))
+
+        self.assertNotEqual(self.ran_on, [pooled])
+        self.assertEqual(len(self.pool.created), 2)
+
+    def test_leased_vm_is_not_leased_again(self):
+        vm = self.pool.add_vm(
+            "qiime", {'imageRef': "360427", 'flavorRef': "101"})
+        self.pool.lease("qiime", {'imageRef': "360427", 'flavorRef': "101"},
+                        "100")
+
+        self.run_job(pool_commands())
+
+        self.assertNotEqual(self.ran_on, [vm])
+        self.assertEqual(len(self.pool.created), 2)
+
+    def test_failed_job_vm_back_after_lease_time(self):
+        vm = self.pool.add_vm(
+            "qiime", {'imageRef': "360427", 'flavorRef': "101"})
+
+        def fail(vm):
+            raise RuntimeError("ON block failed")
+
+        self.assertRaises(
+            RuntimeError, run_zone, pool_commands(), self.pool, fail)
+        self.assertFalse(self.pool.is_idle(vm))
+
+        self.pool.now = 100
+        self.assertTrue(self.pool.is_idle(vm))
+        self.run_job(pool_commands())
+        self.assertEqual(self.ran_on, [vm])
+
+    def test_no_pool(self):
+        commands = pool_commands(pool=None)
+
+        self.assertTrue("LEASEVM" not in commands)
+        self.assertTrue("RELEASEVM" not in commands)
+        self.run_job(commands)
+        self.assertEqual(self.ran_on, self.pool.created)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+__author__ = "Icaro Raupp Henrique"
+__copyright__ = ""
+__credits__ = ["Icaro Raupp Henrique"]
+__license__ = ""
+__version__ = "2.2.1"
+__maintainer__ = "Icaro Raupp Henrique"
+__email__ = "icaro.henrique@cpca.pucrs.br"
+__status__ = ""
+
+import os
+import sys
+import time
+import unittest
+
+from os.path import exists, join
+from shutil import rmtree
+from StringIO import StringIO
+from tempfile import mkdtemp
+
+from helpers import default_params_cmd
+from nshell_generator import changed_scripts, regenerate_scripts
+
+SCRIPT = """from optparse import make_option
+script_info = {}
+script_info['brief_description'] = "%s"
+script_info['version'] = "1.8.0"
+script_info['required_options'] = [
+    make_option('-i', '--input', type="string", help='input')
+]
+"""
+HELPER = """def helper():
+    return 1
+"""
+
+
+class WatchTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.watch_dir = join(self.tmp_dir, "scripts")
+        self.output_dir = join(self.tmp_dir, "output")
+        os.mkdir(self.watch_dir)
+        os.mkdir(self.output_dir)
+
+        self.script_a = self.write("watch_script_a.py", SCRIPT % "A")
+        self.script_b = self.write("watch_script_b.py", SCRIPT % "B")
+        self.helper = self.write("watch_helper.py", HELPER)
+        self.concat = join(self.tmp_dir, "concat.n")
+        with open(self.concat, 'w') as concat_file:
+            concat_file.write("echo concat ;\n")
+
+        # As in watch mode, scripts are imported from the watched folder
+        sys.path.insert(0, self.watch_dir)
+        self.dont_write_bytecode = sys.dont_write_bytecode
+        sys.dont_write_bytecode = True
+
+    def tearDown(self):
+        sys.path.remove(self.watch_dir)
+        sys.dont_write_bytecode = self.dont_write_bytecode
+        for name in sys.modules.keys():
+            if name.startswith("watch_"):
+                del sys.modules[name]
+        rmtree(self.tmp_dir)
+
+    def write(self, name, content):
+        path = join(self.watch_dir, name)
+        with open(path, 'w') as script_file:
+            script_file.write(content)
+        return path
+
+    def changed_scripts(self, changed):
+        return changed_scripts(changed, self.watch_dir, self.concat)
+
+    def regenerate(self, scripts):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            latencies = regenerate_scripts(
+                scripts, self.output_dir,
+                default_params_cmd(concat=self.concat))
+            return latencies, sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_changed_script(self):
+        self.assertEqual(self.changed_scripts({self.script_a: 5}),
+                         {self.script_a: 5})
+
+    def test_changed_helper_ignored(self):
+        self.assertEqual(self.changed_scripts({self.helper: 5}), {})
+
+    def test_other_files_ignored(self):
+        editor_file = self.write(".#watch_script_a.py", SCRIPT % "A")
+        text_file = self.write("notes.txt", "notes")
+        other_script = join(self.tmp_dir, "watch_script_c.py")
+        with open(other_script, 'w') as script_file:
+            script_file.write(SCRIPT % "C")
+
+        self.assertEqual(self.changed_scripts({
+            editor_file: 1, text_file: 2, other_script: 3}), {})
+
+    def test_removed_script_ignored(self):
+        os.remove(self.script_a)
+
+        self.assertEqual(self.changed_scripts({self.script_a: 5}), {})
+
+    def test_concat_changed(self):
+        self.assertEqual(self.changed_scripts({self.concat: 5}),
+                         {self.script_a: 5, self.script_b: 5})
+
+    def test_first_change_time(self):
+        self.assertEqual(
+            self.changed_scripts({self.concat: 5, self.script_a: 3}),
+            {self.script_a: 3, self.script_b: 5})
+        self.assertEqual(
+            self.changed_scripts({self.concat: 3, self.script_a: 5}),
+            {self.script_a: 3, self.script_b: 3})
+
+    def test_regenerate(self):
+        changed_time = time.time() - 1
+        latencies, output = self.regenerate(
+            self.changed_scripts({self.concat: changed_time}))
+
+        self.assertEqual(sorted(latencies.keys()),
+                         [self.script_a, self.script_b])
+        self.assertTrue(latencies[self.script_a] >= 1000)
+        self.assertTrue("Regenerated 'watch_script_a.py' in " in output)
+        self.assertTrue(exists(join(self.output_dir, "watch_script_a.n")))
+        self.assertTrue(exists(join(self.output_dir, "watch_script_b.n")))
+
+    def test_regenerate_changed_script(self):
+        self.regenerate({self.script_a: time.time()})
+        self.write("watch_script_a.py", SCRIPT % "Edited")
+        self.regenerate({self.script_a: time.time()})
+
+        with open(join(self.output_dir, "watch_script_a.n")) as nshell_file:
+            self.assertTrue("description\t: Edited\n" in nshell_file.read())
+
+    def test_failed_regeneration_not_reported(self):
+        broken = self.write("watch_broken.py", "script_info = {\n")
+
+        latencies, output = self.regenerate(
+            self.changed_scripts({broken: time.time(),
+                                  self.script_a: time.time()}))
+
+        self.assertEqual(latencies.keys(), [self.script_a])
+        self.assertTrue("Error processing 'watch_broken'" in output)
+        self.assertFalse("Regenerated 'watch_broken.py'" in output)
+
+
+if __name__ == '__main__':
+    unittest.main()